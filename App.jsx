@@ -404,9 +404,9 @@ export default function MarketInsightApp() {
 
   // ============ Helper Functions ============
   const calculateChange = (data) => {
-    if (!data.historical?.Close) return '+0.00%';
+    if (!data.historical?.close) return '+0.00%';
     
-    const prices = Object.values(data.historical.Close);
+    const prices = data.historical.close;
     if (prices.length < 2) return '+0.00%';
     
     const oldPrice = prices[0];
@@ -425,13 +425,12 @@ export default function MarketInsightApp() {
   };
 
   const formatHistoricalData = (historical) => {
-    if (!historical?.Close) return [];
+    if (!historical?.close) return [];
     
-    const dates = Object.keys(historical.Close);
-    const prices = Object.values(historical.Close);
+    const { dates, close: prices } = historical;
     
     return dates.map((date, idx) => ({
-      date: new Date(parseInt(date)).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
+      date: new Date(date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
       price: prices[idx]
     })).slice(-30); // Last 30 days for better visualization
   };
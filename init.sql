@@ -135,23 +135,39 @@ CREATE TABLE IF NOT EXISTS alerts (
 
 CREATE INDEX idx_alerts_user_active ON alerts(user_id, is_active);
 CREATE INDEX idx_alerts_company ON alerts(company_id);
+-- Pending alerts scanned by check_price_alerts every 15 minutes
+CREATE INDEX idx_alerts_pending ON alerts(company_id)
+    WHERE is_active = true AND triggered_at IS NULL;
 
 -- ============ News Sentiment ============
+-- One aggregate sentiment result per analyzed batch of articles
+CREATE TABLE IF NOT EXISTS news_sentiment_snapshot (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    company_id UUID REFERENCES companies(id) ON DELETE CASCADE,
+    sentiment_score DECIMAL(3, 2), -- -1.0 to 1.0
+    sentiment_label VARCHAR(20), -- positive, negative, neutral
+    key_themes JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_news_snapshot_company_date ON news_sentiment_snapshot(company_id, created_at DESC);
+CREATE INDEX idx_news_snapshot_score ON news_sentiment_snapshot(sentiment_score);
+
 CREATE TABLE IF NOT EXISTS news_sentiment (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     company_id UUID REFERENCES companies(id) ON DELETE CASCADE,
+    snapshot_id UUID REFERENCES news_sentiment_snapshot(id) ON DELETE SET NULL,
     title VARCHAR(500),
     source VARCHAR(100),
     url VARCHAR(1000),
     published_at TIMESTAMP WITH TIME ZONE,
-    sentiment_score DECIMAL(3, 2), -- -1.0 to 1.0
-    sentiment_label VARCHAR(20), -- positive, negative, neutral
     summary TEXT,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT news_sentiment_uniq UNIQUE (company_id, url)
 );
 
 CREATE INDEX idx_news_company_date ON news_sentiment(company_id, published_at DESC);
-CREATE INDEX idx_news_sentiment_score ON news_sentiment(sentiment_score);
+CREATE INDEX idx_news_snapshot ON news_sentiment(snapshot_id);
 
 -- ============ API Usage Tracking ============
 CREATE TABLE IF NOT EXISTS api_usage (
@@ -287,6 +303,20 @@ LIMIT 20;
 
 CREATE INDEX idx_top_performers ON top_performers(change_30d_pct DESC);
 
+-- Daily change % per company (refreshed by the workers after each ingest)
+CREATE MATERIALIZED VIEW IF NOT EXISTS market_daily_change AS
+SELECT 
+    company_id,
+    date,
+    close_price,
+    (close_price - LAG(close_price) OVER (PARTITION BY company_id ORDER BY date)) /
+        NULLIF(LAG(close_price) OVER (PARTITION BY company_id ORDER BY date), 0) * 100 as change_pct
+FROM market_data;
+
+-- Unique index required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX idx_market_daily_change_company_date ON market_daily_change(company_id, date);
+CREATE INDEX idx_market_daily_change_date_pct ON market_daily_change(date, change_pct DESC);
+
 -- ============ Cleanup Functions ============
 
 -- Clean expired AI cache entries
@@ -339,4 +369,5 @@ COMMENT ON TABLE ai_analysis_cache IS 'Cached AI analysis results for performanc
 COMMENT ON TABLE user_queries IS 'User query history and analytics';
 COMMENT ON TABLE watchlists IS 'User-created stock watchlists';
 COMMENT ON TABLE alerts IS 'Price and event alerts';
-COMMENT ON TABLE news_sentiment IS 'News articles with sentiment analysis';
+COMMENT ON TABLE news_sentiment IS 'News articles, linked to the sentiment snapshot they were analyzed in';
+COMMENT ON TABLE news_sentiment_snapshot IS 'Aggregate news sentiment per analyzed batch';
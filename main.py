@@ -3,14 +3,18 @@ Market Insight AI Bot - Production Backend
 FastAPI + OpenAI + LangChain Integration
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+import asyncio
+import hashlib
 import os
+import time
+from textwrap import dedent
 from datetime import datetime, timedelta
-import jwt
 from dotenv import load_dotenv
 
 # AI & Data Processing
@@ -21,9 +25,9 @@ from langchain_community.vectorstores import Pinecone as PineconeStore
 from langchain_openai import OpenAIEmbeddings
 import yfinance as yf
 import pandas as pd
-import redis
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+import numpy as np
+import orjson
+import redis.asyncio as aioredis
 
 load_dotenv()
 
@@ -54,11 +58,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Security
-security = HTTPBearer()
-
-# Redis Cache
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Redis Cache (raw bytes; payloads are orjson-encoded)
+redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=False)
 
 # OpenAI Client
 openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
@@ -82,117 +83,277 @@ class CompetitorAnalysis(BaseModel):
     competitors: List[str]
     metrics: Dict[str, Any]
 
+class AnalysisOut(BaseModel):
+    """JSON object the model is instructed to return"""
+    executive_summary: str = ""
+    key_insights: List[str] = []
+    recommendations: List[str] = []
+    risk_factors: List[str] = []
+    confidence_level: float = Field(0, ge=0, le=100)
+
 # ============ AI Prompt Engineering ============
 class PromptTemplates:
-    SYSTEM_PROMPT = """You are a senior market analyst with 15+ years of experience.
-    Your expertise includes:
-    - Financial statement analysis
-    - Competitive intelligence
-    - Market trend prediction
-    - Risk assessment
+    SYSTEM_PROMPT = dedent("""\
+        You are a senior market analyst (financial statements, competitive intelligence, trends, risk).
+        Be data-driven, specific, actionable, risk-aware and industry-contextualized.
+        Reply with a JSON object with keys:
+        executive_summary (string), key_insights (3-5 strings), recommendations (strings, prioritized),
+        risk_factors (strings), confidence_level (number 0-100).""")
     
-    Provide insights that are:
-    1. Data-driven and specific
-    2. Actionable with clear recommendations
-    3. Risk-aware with uncertainty quantification
-    4. Industry-contextualized
+    MARKET_ANALYSIS = dedent("""\
+        Company: {company}
+        Period: {time_range}
+        Price: ${current_price}
+        Volume: {volume}
+        Market cap: ${market_cap}
+        History: {historical_data}
+        News sentiment: {news_sentiment}
+        Question: {query}
+        Cover price trend, volume, sentiment, growth and risk.""")
     
-    Format responses in JSON structure with:
-    - Executive summary
-    - Key insights (3-5 points)
-    - Recommendations (prioritized)
-    - Risk factors
-    - Confidence level (0-100%)
-    """
+    COMPETITOR_ANALYSIS = dedent("""\
+        Primary company: {company}
+        Competitors: {competitors}
+        Metrics:
+        {metrics_table}
+        Cover competitive positioning, strengths/weaknesses, opportunities, threats and strategy.""")
+
+# ============ Data Collection Services ============
+class MarketDataService:
+    """Real-time market data collection"""
+    
+    # Stale-while-revalidate: entries are fresh for CACHE_SOFT_TTL seconds, then
+    # served stale while a background refresh runs until Redis expires them.
+    CACHE_SOFT_TTL = 60
+    CACHE_HARD_TTL = 3600
+    # Pub/sub channel announcing every market data write
+    TICKS_CHANNEL = "market.ticks"
+    # In-process L1 in front of Redis; only holds entries that are still fresh
+    L1_MAXSIZE = 256
+    _l1: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    
+    @staticmethod
+    async def get_stock_data(
+        ticker: str,
+        period: str = "1mo",
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> Dict[str, Any]:
+        """Fetch real stock data from Yahoo Finance"""
+        cache_key = MarketDataService._cache_key(ticker, period)
+        
+        # Check in-process cache, then Redis
+        data = MarketDataService._l1_get(cache_key)
+        if data is not None:
+            return data
+        
+        cached = await redis_client.get(cache_key)
+        if cached:
+            entry = orjson.loads(cached)
+            if not MarketDataService._is_stale(entry):
+                MarketDataService._l1_put(cache_key, entry)
+                return entry["data"]
+            if background_tasks is not None:
+                background_tasks.add_task(MarketDataService.refresh_stock_data, ticker, period)
+                return entry["data"]
+        
+        try:
+            return await MarketDataService._fetch_and_store(ticker, period)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error fetching data: {str(e)}")
     
-    MARKET_ANALYSIS = """Analyze the following market data:
+    @staticmethod
+    async def refresh_stock_data(ticker: str, period: str):
+        """Background revalidation of a stale cache entry"""
+        lock_key = f"lock:{MarketDataService._cache_key(ticker, period)}"
+        # Only one worker refreshes a given key at a time
+        if not await redis_client.set(lock_key, b"1", nx=True, ex=30):
+            return
+        try:
+            await MarketDataService._fetch_and_store(ticker, period)
+        except Exception:
+            pass  # Keep serving the stale entry; the next request retries
+        finally:
+            await redis_client.delete(lock_key)
     
-    Company: {company}
-    Time Period: {time_range}
-    Current Price: ${current_price}
-    Volume: {volume}
-    Market Cap: ${market_cap}
+    @staticmethod
+    async def _fetch_and_store(ticker: str, period: str) -> Dict[str, Any]:
+        """Fetch from Yahoo Finance and write through to the cache"""
+        # yfinance is blocking; keep it off the event loop
+        hist, info = await asyncio.to_thread(
+            MarketDataService._fetch_ticker, ticker, period
+        )
+        entry = await MarketDataService._store(
+            ticker, period, MarketDataService._build_payload(ticker, hist, info)
+        )
+        return entry["data"]
     
-    Historical Performance:
-    {historical_data}
+    @staticmethod
+    def _cache_key(ticker: str, period: str) -> str:
+        return f"stock:{ticker}:{period}"
     
-    Recent News Sentiment: {news_sentiment}
+    @staticmethod
+    def _is_stale(entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["ts"] > MarketDataService.CACHE_SOFT_TTL
     
-    User Question: {query}
+    @staticmethod
+    async def _store(ticker: str, period: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Write a timestamped payload to both cache tiers and return the decoded entry"""
+        cache_key = MarketDataService._cache_key(ticker, period)
+        encoded = MarketDataService._encode({"ts": time.time(), "data": data})
+        # Keep the decoded form so cache hits and misses look identical
+        entry = orjson.loads(encoded)
+        MarketDataService._l1_put(cache_key, entry)
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.setex(cache_key, MarketDataService.CACHE_HARD_TTL, encoded)
+            # Push a lightweight tick so subscribers don't have to poll the cache
+            pipe.publish(MarketDataService.TICKS_CHANNEL, orjson.dumps({
+                "ticker": ticker,
+                "period": period,
+                "current_price": data["current_price"],
+                "ts": entry["ts"],
+            }))
+            await pipe.execute()
+        return entry
     
-    Provide comprehensive analysis covering:
-    1. Price trend analysis
-    2. Volume patterns
-    3. Market sentiment
-    4. Growth indicators
-    5. Risk assessment
-    """
+    @staticmethod
+    def _l1_get(cache_key: str) -> Optional[Dict[str, Any]]:
+        l1 = MarketDataService._l1
+        entry = l1.get(cache_key)
+        if entry is None:
+            return None
+        if MarketDataService._is_stale(entry):
+            del l1[cache_key]
+            return None
+        l1.move_to_end(cache_key)
+        return entry["data"]
     
-    COMPETITOR_ANALYSIS = """Compare these companies in the market:
+    @staticmethod
+    def _l1_put(cache_key: str, entry: Dict[str, Any]):
+        l1 = MarketDataService._l1
+        l1[cache_key] = entry
+        l1.move_to_end(cache_key)
+        if len(l1) > MarketDataService.L1_MAXSIZE:
+            l1.popitem(last=False)
     
-    Primary Company: {company}
-    Competitors: {competitors}
+    @staticmethod
+    def _fetch_ticker(ticker: str, period: str):
+        """Blocking yfinance fetch of price history and company info"""
+        stock = yf.Ticker(ticker)
+        return stock.history(period=period), stock.info
     
-    Metrics Comparison:
-    {metrics_table}
+    @staticmethod
+    def _build_payload(ticker: str, hist: pd.DataFrame, info: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape yfinance history/info into the cached market data payload"""
+        return {
+            "ticker": ticker,
+            "current_price": info.get("currentPrice", 0),
+            "market_cap": info.get("marketCap", 0),
+            "volume": info.get("volume", 0),
+            "pe_ratio": info.get("trailingPE", 0),
+            "eps": info.get("trailingEps", 0),
+            "revenue": info.get("totalRevenue", 0),
+            "profit_margin": info.get("profitMargins", 0),
+            "historical": MarketDataService._compact_history(hist),
+            "52_week_high": info.get("fiftyTwoWeekHigh", 0),
+            "52_week_low": info.get("fiftyTwoWeekLow", 0),
+        }
     
-    Market Share Data:
-    {market_share}
+    @staticmethod
+    def _compact_history(hist: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Columnar OHLCV arrays with epoch-millisecond dates (prices as float32)"""
+        return {
+            "dates": hist.index.asi8 // 1_000_000,
+            "open": hist["Open"].to_numpy(dtype=np.float32),
+            "high": hist["High"].to_numpy(dtype=np.float32),
+            "low": hist["Low"].to_numpy(dtype=np.float32),
+            "close": hist["Close"].to_numpy(dtype=np.float32),
+            "volume": hist["Volume"].to_numpy(dtype=np.int64),
+        }
     
-    Analyze:
-    1. Competitive positioning
-    2. Strengths/Weaknesses
-    3. Market opportunities
-    4. Threats and risks
-    5. Strategic recommendations
-    """
-
-# ============ Data Collection Services ============
-class MarketDataService:
-    """Real-time market data collection"""
+    @staticmethod
+    def _encode(data: Dict[str, Any]) -> bytes:
+        """Serialize a market data payload for Redis"""
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
     
     @staticmethod
-    async def get_stock_data(ticker: str, period: str = "1mo") -> Dict[str, Any]:
-        """Fetch real stock data from Yahoo Finance"""
-        cache_key = f"stock:{ticker}:{period}"
-        
-        # Check cache first
-        cached = redis_client.get(cache_key)
-        if cached:
-            return eval(cached)
+    def _fetch_info(ticker: str) -> Dict[str, Any]:
+        """Blocking yfinance company info lookup (cannot be batched)"""
+        return yf.Ticker(ticker).info
+    
+    @staticmethod
+    async def _download_bulk(tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """
+        Fetch price history for several tickers in one yfinance request.
+        Keys are upper-cased tickers; tickers with no data are left out.
+        """
+        # yf.download upper-cases and de-duplicates its input; key results the same way
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        frame = await asyncio.to_thread(
+            yf.download, tickers,
+            period=period, group_by="ticker", threads=True, progress=False
+        )
+        if len(tickers) == 1:
+            frame = frame.dropna(how="all")
+            return {tickers[0]: frame} if not frame.empty else {}
         
-        try:
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period=period)
-            info = stock.info
-            
-            data = {
-                "ticker": ticker,
-                "current_price": info.get("currentPrice", 0),
-                "market_cap": info.get("marketCap", 0),
-                "volume": info.get("volume", 0),
-                "pe_ratio": info.get("trailingPE", 0),
-                "eps": info.get("trailingEps", 0),
-                "revenue": info.get("totalRevenue", 0),
-                "profit_margin": info.get("profitMargins", 0),
-                "historical": hist.to_dict(),
-                "52_week_high": info.get("fiftyTwoWeekHigh", 0),
-                "52_week_low": info.get("fiftyTwoWeekLow", 0),
-            }
-            
-            # Cache for 15 minutes
-            redis_client.setex(cache_key, 900, str(data))
-            return data
-            
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error fetching data: {str(e)}")
+        available = set(frame.columns.get_level_values(0))
+        histories = {
+            ticker: frame[ticker].dropna(how="all") for ticker in tickers if ticker in available
+        }
+        return {ticker: data for ticker, data in histories.items() if not data.empty}
     
     @staticmethod
-    async def get_competitor_comparison(tickers: List[str]) -> pd.DataFrame:
+    async def get_competitor_comparison(
+        tickers: List[str],
+        period: str = "1mo",
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> pd.DataFrame:
         """Compare multiple companies"""
+        # Match yfinance's symbols; a company repeated among competitors is compared once
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        stocks = {}
+        for ticker in tickers:
+            data = MarketDataService._l1_get(MarketDataService._cache_key(ticker, period))
+            if data is not None:
+                stocks[ticker] = data
+        
+        remote = [ticker for ticker in tickers if ticker not in stocks]
+        cache_keys = [MarketDataService._cache_key(ticker, period) for ticker in remote]
+        cached = await redis_client.mget(cache_keys) if cache_keys else []
+        for ticker, cache_key, raw in zip(remote, cache_keys, cached):
+            if not raw:
+                continue
+            entry = orjson.loads(raw)
+            if MarketDataService._is_stale(entry):
+                if background_tasks is None:
+                    continue
+                background_tasks.add_task(MarketDataService.refresh_stock_data, ticker, period)
+            else:
+                MarketDataService._l1_put(cache_key, entry)
+            stocks[ticker] = entry["data"]
+        
+        # One batched history download for every cache miss; info lookups run concurrently
+        missing = [ticker for ticker in tickers if ticker not in stocks]
+        if missing:
+            histories = await MarketDataService._download_bulk(missing, period)
+            infos = await asyncio.gather(
+                *(asyncio.to_thread(MarketDataService._fetch_info, ticker) for ticker in missing),
+                return_exceptions=True
+            )
+            for ticker, info in zip(missing, infos):
+                # Skip tickers whose fetch failed rather than failing the comparison
+                if isinstance(info, Exception) or ticker not in histories:
+                    continue
+                stock_data = MarketDataService._build_payload(ticker, histories[ticker], info)
+                # Warm the per-ticker cache used by get_stock_data
+                stocks[ticker] = (await MarketDataService._store(ticker, period, stock_data))["data"]
+        
         data = []
         for ticker in tickers:
-            stock_data = await MarketDataService.get_stock_data(ticker)
+            stock_data = stocks.get(ticker)
+            if stock_data is None:
+                continue
             data.append({
                 "Company": ticker,
                 "Price": stock_data["current_price"],
@@ -203,78 +364,157 @@ class MarketDataService:
             })
         return pd.DataFrame(data)
 
+class NewsService:
+    """Recent news sentiment per company"""
+    
+    @staticmethod
+    async def sentiment(ticker: str) -> str:
+        """Summarized news sentiment label for a ticker"""
+        return "Positive (75%)"  # TODO: Integrate news API
+
 # ============ AI Analysis Engine ============
 class AIAnalysisEngine:
     """Advanced AI-powered analysis"""
     
+    MODEL = "gpt-4-turbo-preview"
+    # Completed analyses are reused for identical (coarsened) inputs
+    ANALYSIS_CACHE_TTL = 900
+    
     @staticmethod
-    async def analyze_market(query: MarketQuery) -> MarketAnalysisResponse:
+    async def analyze_market(
+        query: MarketQuery,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> MarketAnalysisResponse:
         """Main analysis function using GPT-4"""
         
         # 1. Collect real data
-        stock_data = await MarketDataService.get_stock_data(
-            query.company, 
-            query.time_range
+        stock_data, news_sentiment = await AIAnalysisEngine._collect_inputs(
+            query, background_tasks
         )
         
-        # 2. Prepare context for AI
-        historical_summary = AIAnalysisEngine._summarize_historical_data(
-            stock_data["historical"]
+        # 2. Build prompt
+        analysis_prompt = AIAnalysisEngine._build_analysis_prompt(
+            query, stock_data, news_sentiment
         )
         
-        # 3. Build prompt
-        analysis_prompt = PromptTemplates.MARKET_ANALYSIS.format(
-            company=query.company,
-            time_range=query.time_range,
-            current_price=stock_data["current_price"],
-            volume=stock_data["volume"],
-            market_cap=stock_data["market_cap"],
-            historical_data=historical_summary,
-            news_sentiment="Positive (75%)",  # TODO: Integrate news API
-            query=query.query
+        # 3. Call GPT-4 with structured output (price bucketed to whole dollars)
+        cache_key = AIAnalysisEngine.analysis_cache_key(
+            "market", query.company, query.time_range,
+            round(stock_data["current_price"] or 0), query.query
         )
-        
-        # 4. Call GPT-4 with structured output
-        response = await openai_client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": PromptTemplates.SYSTEM_PROMPT},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            response_format={"type": "json_object"},
+        analysis_result = await AIAnalysisEngine.complete_json(
+            cache_key,
+            analysis_prompt,
             temperature=0.3  # Lower for consistent analysis
         )
         
-        analysis_result = eval(response.choices[0].message.content)
-        
         return MarketAnalysisResponse(
-            analysis=analysis_result.get("executive_summary", ""),
-            insights=analysis_result.get("key_insights", []),
+            analysis=analysis_result.executive_summary,
+            insights=[{"text": insight} for insight in analysis_result.key_insights],
             data=stock_data,
-            confidence_score=analysis_result.get("confidence_level", 0) / 100,
+            confidence_score=analysis_result.confidence_level / 100,
             timestamp=datetime.now()
         )
     
+    @staticmethod
+    async def stream_analysis(
+        query: MarketQuery,
+        background_tasks: Optional[BackgroundTasks] = None
+    ):
+        """Start a streamed completion for a market analysis"""
+        stock_data, news_sentiment = await AIAnalysisEngine._collect_inputs(
+            query, background_tasks
+        )
+        return await openai_client.chat.completions.create(
+            model=AIAnalysisEngine.MODEL,
+            messages=AIAnalysisEngine._messages(
+                AIAnalysisEngine._build_analysis_prompt(query, stock_data, news_sentiment)
+            ),
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            stream=True
+        )
+    
+    @staticmethod
+    async def complete_json(cache_key: str, prompt: str, **kwargs) -> AnalysisOut:
+        """JSON-mode chat completion, served from Redis when already computed"""
+        cached = await redis_client.get(cache_key)
+        if cached:
+            return AnalysisOut.model_validate_json(cached)
+        
+        response = await openai_client.chat.completions.create(
+            model=AIAnalysisEngine.MODEL,
+            messages=AIAnalysisEngine._messages(prompt),
+            response_format={"type": "json_object"},
+            **kwargs
+        )
+        result = AnalysisOut.model_validate_json(response.choices[0].message.content)
+        await redis_client.setex(
+            cache_key, AIAnalysisEngine.ANALYSIS_CACHE_TTL, result.model_dump_json()
+        )
+        return result
+    
+    @staticmethod
+    def analysis_cache_key(*parts) -> str:
+        """Redis key for a completed analysis of the given inputs"""
+        digest = hashlib.sha256(orjson.dumps([AIAnalysisEngine.MODEL, *parts])).hexdigest()
+        return f"analysis:{digest}"
+    
+    @staticmethod
+    def _messages(prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": PromptTemplates.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @staticmethod
+    async def _collect_inputs(
+        query: MarketQuery,
+        background_tasks: Optional[BackgroundTasks] = None
+    ):
+        """Fetch stock data and news sentiment concurrently"""
+        return await asyncio.gather(
+            MarketDataService.get_stock_data(query.company, query.time_range, background_tasks),
+            NewsService.sentiment(query.company)
+        )
+    
+    @staticmethod
+    def _build_analysis_prompt(
+        query: MarketQuery,
+        stock_data: Dict[str, Any],
+        news_sentiment: str
+    ) -> str:
+        """Fill the market analysis template from fetched stock data"""
+        historical_summary = AIAnalysisEngine._summarize_historical_data(
+            stock_data["historical"]
+        )
+        return PromptTemplates.MARKET_ANALYSIS.format(
+            company=query.company,
+            time_range=query.time_range,
+            current_price=f"{stock_data['current_price'] or 0:.2f}",
+            volume=f"{stock_data['volume'] or 0:,}",
+            market_cap=f"{stock_data['market_cap'] or 0:,}",
+            historical_data=historical_summary,
+            news_sentiment=news_sentiment,
+            query=query.query
+        )
+    
     @staticmethod
     def _summarize_historical_data(historical: Dict) -> str:
         """Convert historical data to readable summary"""
-        if not historical or not historical.get("Close"):
+        if not historical or not historical.get("close"):
             return "No historical data available"
         
-        prices = list(historical["Close"].values())
+        prices = historical["close"]
         if len(prices) < 2:
             return f"Current price: ${prices[0]:.2f}"
         
         start_price = prices[0]
         end_price = prices[-1]
         change_pct = ((end_price - start_price) / start_price) * 100
+        trend = 'upward' if change_pct > 0 else 'downward'
         
-        return f"""
-        Start Price: ${start_price:.2f}
-        End Price: ${end_price:.2f}
-        Change: {change_pct:+.2f}%
-        Trend: {'Upward' if change_pct > 0 else 'Downward'}
-        """
+        return f"${start_price:.2f} -> ${end_price:.2f} ({change_pct:+.2f}%, {trend})"
 
 # ============ API Endpoints ============
 
@@ -288,7 +528,7 @@ async def root():
     }
 
 @app.post("/api/v2/analyze", response_model=MarketAnalysisResponse)
-async def analyze_market(query: MarketQuery):
+async def analyze_market(query: MarketQuery, background_tasks: BackgroundTasks):
     """
     Advanced market analysis endpoint
     
@@ -300,56 +540,72 @@ async def analyze_market(query: MarketQuery):
     }
     """
     try:
-        result = await AIAnalysisEngine.analyze_market(query)
+        result = await AIAnalysisEngine.analyze_market(query, background_tasks)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v2/analyze/stream")
+async def analyze_market_stream(query: MarketQuery, background_tasks: BackgroundTasks):
+    """
+    Market analysis streamed as server-sent events while it is generated
+    """
+    try:
+        stream = await AIAnalysisEngine.stream_analysis(query, background_tasks)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield f"data: {orjson.dumps(chunk.choices[0].delta.content).decode()}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.post("/api/v2/competitor-analysis")
-async def compare_competitors(analysis: CompetitorAnalysis):
+async def compare_competitors(analysis: CompetitorAnalysis, background_tasks: BackgroundTasks):
     """
     Compare company against competitors
     """
     try:
         tickers = [analysis.company] + analysis.competitors
-        comparison_df = await MarketDataService.get_competitor_comparison(tickers)
+        comparison_df = await MarketDataService.get_competitor_comparison(
+            tickers, background_tasks=background_tasks
+        )
         
         # AI-powered competitive analysis
         prompt = PromptTemplates.COMPETITOR_ANALYSIS.format(
             company=analysis.company,
             competitors=", ".join(analysis.competitors),
-            metrics_table=comparison_df.to_string(),
-            market_share="TODO: Integrate market share data"
+            metrics_table=comparison_df.to_string()
         )
         
-        response = await openai_client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": PromptTemplates.SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+        prices = comparison_df.get("Price", pd.Series(dtype=float))
+        cache_key = AIAnalysisEngine.analysis_cache_key(
+            "competitors", tickers, prices.fillna(0).round().astype(int).tolist()
         )
+        ai_analysis = await AIAnalysisEngine.complete_json(cache_key, prompt)
         
         return {
             "comparison_data": comparison_df.to_dict(),
-            "ai_analysis": eval(response.choices[0].message.content)
+            "ai_analysis": ai_analysis.model_dump()
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v2/market-data/{ticker}")
-async def get_market_data(ticker: str, period: str = "1mo"):
+async def get_market_data(ticker: str, background_tasks: BackgroundTasks, period: str = "1mo"):
     """Get raw market data for a company"""
-    return await MarketDataService.get_stock_data(ticker, period)
+    return await MarketDataService.get_stock_data(ticker, period, background_tasks)
 
 @app.get("/api/v2/health")
 async def health_check():
     """System health check"""
     return {
         "status": "healthy",
-        "redis": redis_client.ping(),
+        "redis": await redis_client.ping(),
         "timestamp": datetime.now().isoformat()
     }
 